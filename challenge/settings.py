@@ -37,7 +37,23 @@ REST_FRAMEWORK = {
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'chirper.throttling.AnonReadThrottle',
+        'chirper.throttling.AnonWriteThrottle',
+        'chirper.throttling.UserReadThrottle',
+        'chirper.throttling.UserWriteThrottle',
+    ),
+    # Number of proxies in front of the app. Anonymous clients are throttled by
+    # IP, and with no proxy X-Forwarded-For is client-supplied and ignored
+    'NUM_PROXIES': int(os.environ.get('CHIRPER_NUM_PROXIES', 0)),
+    # Token bucket sizes and refill rates; see chirper.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'anon_read': '60/min',
+        'anon_write': '30/min',
+        'user_read': '600/min',
+        'user_write': '120/min',
+    },
 }
 
 # Application definition
@@ -74,10 +90,50 @@ WSGI_APPLICATION = 'challenge.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get('CHIRPER_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
     }
 }
 
+# Set CHIRPER_DB_PROFILE=production to keep connections open between requests
+# and let readers and writers work concurrently. SQLITE_PRAGMAS are run, in
+# order, on every new SQLite connection; see chirper.db.
+DATABASE_PROFILE = os.environ.get('CHIRPER_DB_PROFILE', 'development')
+
+SQLITE_PRAGMAS = ()
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('CHIRPER_DB_CONN_MAX_AGE', 600)),
+        'OPTIONS': {
+            # Seconds to wait for a lock before raising "database is locked"
+            'timeout': int(os.environ.get('CHIRPER_DB_BUSY_TIMEOUT', 20)),
+        },
+    })
+    SQLITE_PRAGMAS = (
+        ('journal_mode', 'WAL'),
+        # Safe with WAL: a power loss can only lose the latest transactions
+        ('synchronous', 'NORMAL'),
+        ('mmap_size', int(os.environ.get('CHIRPER_DB_MMAP_SIZE', 256 * 1024 * 1024))),
+    )
+
+# Caches
+# https://docs.djangoproject.com/en/1.7/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+        'OPTIONS': {
+            # One bucket per active client and scope; culling at the default
+            # 300 entries would hand evicted clients a full bucket
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
 
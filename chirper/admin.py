@@ -1,6 +1,146 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, SEARCH_VAR
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
 
 from chirper.models import UserProfile, Chirp
 
-admin.site.register(UserProfile)
-admin.site.register(Chirp)
+def approximate_count(model):
+    """
+    Estimate the number of rows in a model's table without scanning it. On
+    PostgreSQL this is the planner's row estimate; elsewhere it's the largest
+    primary key, which is an index lookup but overcounts once rows are deleted.
+    """
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [model._meta.db_table])
+        row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+
+    return model._default_manager.aggregate(largest=Max('pk'))['largest'] or 0
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator that estimates the size of an unfiltered changelist instead of
+    running an exact COUNT(*) over the whole table. Filtered and searched
+    changelists are still counted exactly.
+    """
+    def _get_count(self):
+        if self._count is None and not self.object_list.query.where:
+            self._count = approximate_count(self.object_list.model)
+        return super(ApproximateCountPaginator, self)._get_count()
+    count = property(_get_count)
+
+class LargeTableChangeList(ChangeList):
+    """
+    ChangeList that avoids full table scans:
+
+    - The unfiltered total shown beside a filtered or searched list is
+      estimated rather than counted.
+    - The date hierarchy is only shown once a date has been chosen, because
+      its top level lists the distinct years of every row in the table.
+    """
+    def __init__(self, *args, **kwargs):
+        super(LargeTableChangeList, self).__init__(*args, **kwargs)
+        if self.date_hierarchy:
+            date_params = '%s__' % self.date_hierarchy
+            if not any(param.startswith(date_params) for param in self.params):
+                self.date_hierarchy = None
+
+    def get_results(self, request):
+        # Same as ChangeList.get_results, except for full_result_count
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        result_count = paginator.count
+
+        if self.get_filters_params() or self.params.get(SEARCH_VAR):
+            full_result_count = approximate_count(self.model)
+        else:
+            full_result_count = result_count
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()
+        else:
+            try:
+                result_list = paginator.page(self.page_num + 1).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+
+        self.result_count = result_count
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
+class TimePostedYearFilter(admin.SimpleListFilter):
+    """
+    Lets a year be chosen for the chirp date hierarchy. The years offered come
+    from the first and last time_posted, which are two index lookups, and the
+    parameter is the one the date hierarchy itself uses.
+    """
+    title = 'year posted'
+    parameter_name = 'time_posted__year'
+
+    def lookups(self, request, model_admin):
+        chirps = model_admin.model._default_manager
+        first = chirps.aggregate(first=Min('time_posted'))['first']
+        last = chirps.aggregate(last=Max('time_posted'))['last']
+        if first is None or last is None:
+            return []
+
+        first, last = [timezone.localtime(value) if timezone.is_aware(value) else value
+                       for value in (first, last)]
+        return [(str(year), str(year)) for year in range(last.year, first.year - 1, -1)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(time_posted__year=self.value())
+        return queryset
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables too large to count or scan on every page load.
+    Searches match usernames starting with the search term, case-sensitively,
+    as a range on 'username_field'. The default '^' search is a
+    case-insensitive LIKE, which can't use the username index.
+    """
+    paginator = ApproximateCountPaginator
+    username_field = 'username'
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        return queryset.filter(**{
+            self.username_field + '__gte': search_term,
+            self.username_field + '__lt': search_term + u'\uffff',
+        }), False
+
+class UserProfileAdmin(LargeTableAdmin):
+    list_display = ('username', 'email', 'date_joined', 'is_staff')
+    search_fields = ('username',)
+    # The default widget for 'following' renders every user in the table
+    raw_id_fields = ('following',)
+
+class ChirpAdmin(LargeTableAdmin):
+    list_display = ('text', 'author', 'time_posted')
+    list_select_related = ('author',)
+    list_filter = (TimePostedYearFilter,)
+    search_fields = ('author__username',)
+    username_field = 'author__username'
+    raw_id_fields = ('author',)
+    date_hierarchy = 'time_posted'
+    ordering = ('-time_posted',)
+
+admin.site.register(UserProfile, UserProfileAdmin)
+admin.site.register(Chirp, ChirpAdmin)
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
+
+
+class ChirperConfig(AppConfig):
+    name = 'chirper'
+
+    def ready(self):
+        from chirper import db
+
+        connection_created.connect(db.apply_pragmas)
+        checks.register()(db.check_database_profile)
@@ -0,0 +1,66 @@
+"""
+SQLite connection setup for the database profiles in challenge.settings.
+"""
+from django.conf import settings
+from django.core import checks
+from django.db import connection
+
+# PRAGMA synchronous reports a number rather than the name it was set with
+SYNCHRONOUS_LEVELS = {'off': '0', 'normal': '1', 'full': '2', 'extra': '3'}
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """
+    connection_created receiver that runs SQLITE_PRAGMAS on new connections.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    for name, value in settings.SQLITE_PRAGMAS:
+        connection.connection.execute('PRAGMA %s = %s' % (name, value))
+
+
+def effective_settings():
+    """
+    Read back the settings SQLite is actually using on the default connection.
+    """
+    cursor = connection.cursor()
+    effective = {}
+    for name in ('journal_mode', 'synchronous', 'mmap_size', 'busy_timeout'):
+        cursor.execute('PRAGMA %s' % name)
+        row = cursor.fetchone()
+        effective[name] = row[0] if row else None
+    effective['conn_max_age'] = connection.settings_dict['CONN_MAX_AGE']
+    return effective
+
+
+def check_database_profile(app_configs, **kwargs):
+    """
+    In the production profile, report the effective SQLite settings. In any
+    profile, warn about a configured pragma that didn't take, e.g. WAL on a
+    filesystem that doesn't support it.
+    """
+    production = settings.DATABASE_PROFILE == 'production'
+    if connection.vendor != 'sqlite' or not (production or settings.SQLITE_PRAGMAS):
+        return []
+
+    effective = effective_settings()
+    messages = []
+    if production:
+        messages.append(checks.Info(
+            "Database profile '%s': %s." % (settings.DATABASE_PROFILE, ', '.join(
+                '%s=%s' % (name, effective[name]) for name in sorted(effective))),
+            id='chirper.I001',
+        ))
+
+    for name, value in settings.SQLITE_PRAGMAS:
+        wanted = str(value).lower()
+        wanted = SYNCHRONOUS_LEVELS.get(wanted, wanted) if name == 'synchronous' else wanted
+        if str(effective.get(name)).lower() != wanted:
+            messages.append(checks.Warning(
+                "SQLite pragma %s is %s rather than the configured %s." % (name, effective.get(name), value),
+                hint="Check that the SQLite build and filesystem support this setting.",
+                id='chirper.W001',
+            ))
+
+    return messages
@@ -0,0 +1,266 @@
+"""
+A small database-backed job queue. Views call enqueue() once their primary row
+has been saved and return straight away; the derived work is done later by the
+'runworkers' management command.
+
+Handlers are registered with the @handler decorator in chirper.tasks. Each
+handler receives a list of payloads so that similar jobs can be processed in a
+single batch. Handlers must be idempotent: a batch that raises is retried with
+exponential backoff, and a crashed worker's batch is eventually picked up by
+another worker. Either way a job that keeps failing is marked as failed once it
+runs out of attempts.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+from importlib import import_module
+
+from django.db import close_old_connections, connection
+from django.db.models import Min
+from django.utils import timezone
+
+from chirper.models import Job
+
+# Seconds to wait before the first retry; doubled on every further attempt
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 60 * 60
+
+# A running job that hasn't finished after this many seconds is assumed to
+# belong to a dead worker and is put back on the queue
+STALE_AFTER = 5 * 60
+
+HANDLERS = {}
+_tasks_loaded = False
+
+logger = logging.getLogger(__name__)
+
+
+class Handler(object):
+    def __init__(self, func, batch_size, max_attempts):
+        self.func = func
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+
+
+def handler(name, batch_size=1, max_attempts=5):
+    """
+    Register the decorated function as the handler for jobs called 'name'. Up to
+    'batch_size' pending jobs with that name are passed to the function at once.
+    """
+    def register(func):
+        HANDLERS[name] = Handler(func, batch_size, max_attempts)
+        return func
+    return register
+
+
+def load_tasks():
+    """
+    Import chirper.tasks so that its handlers are registered.
+    """
+    global _tasks_loaded
+    if not _tasks_loaded:
+        import_module('chirper.tasks')
+        _tasks_loaded = True
+
+
+def enqueue(name, payload=None, dedupe_key='', delay=0):
+    """
+    Add a job to the queue and return it. If 'dedupe_key' is given and a pending
+    job with the same name and key is already queued, no new job is created and
+    None is returned. Raises ValueError if no handler is registered for 'name'.
+    """
+    load_tasks()
+    if name not in HANDLERS:
+        raise ValueError("No handler is registered for '%s' jobs." % name)
+
+    if dedupe_key and Job.objects.filter(name=name, dedupe_key=dedupe_key,
+                                         status=Job.PENDING).exists():
+        return None
+
+    return Job.objects.create(
+        name=name,
+        payload=json.dumps(payload or {}),
+        dedupe_key=dedupe_key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before retrying a job that has failed 'attempts' times.
+    """
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def record_failure(job, error, now):
+    """
+    Count a failed attempt at 'job' and either reschedule it with backoff or,
+    once it has run out of attempts, mark it as failed. Doesn't save the job.
+    """
+    job_handler = HANDLERS.get(job.name)
+    max_attempts = job_handler.max_attempts if job_handler else 1
+
+    job.attempts += 1
+    job.last_error = error
+    job.claimed_by = ''
+    job.claimed_at = None
+    if job.attempts >= max_attempts:
+        job.status = Job.FAILED
+    else:
+        job.status = Job.PENDING
+        job.run_at = now + timedelta(seconds=retry_delay(job.attempts))
+
+
+def requeue_stale_jobs():
+    """
+    Treat running jobs whose worker has stopped responding as failed attempts,
+    so that a payload that keeps killing workers is eventually given up on.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=STALE_AFTER)
+    requeued = 0
+    for job in Job.objects.filter(status=Job.RUNNING, claimed_at__lt=cutoff):
+        claim = current_claim(job)
+        record_failure(job, 'Worker stopped before finishing the job.', now)
+        # Only the worker whose update matches the old claim records the failure
+        requeued += save_failure(claim.filter(pk=job.pk), job)
+    return requeued
+
+
+def current_claim(job):
+    """
+    The job's row, as long as it is still running under the claim 'job' was
+    loaded with. Writes through this queryset can't clobber a later claim.
+    """
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING,
+                              claimed_by=job.claimed_by, claimed_at=job.claimed_at)
+
+
+def save_failure(claim, job):
+    return claim.update(status=job.status, attempts=job.attempts, run_at=job.run_at,
+                        last_error=job.last_error, claimed_by='', claimed_at=None)
+
+
+def claim_batch(worker_id):
+    """
+    Claim the oldest due job plus up to its handler's batch size of other due
+    jobs with the same name. Returns a (name, jobs) tuple, or (None, []) if
+    nothing is due.
+
+    Claiming is a conditional UPDATE on status, so when several workers race
+    for the same rows each row is only handed to one of them.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.PENDING, run_at__lte=now)
+
+    names = list(due.order_by('run_at').values_list('name', flat=True)[:1])
+    if not names:
+        return None, []
+    name = names[0]
+
+    job_handler = HANDLERS.get(name)
+    if job_handler is None:
+        due.filter(name=name).update(status=Job.FAILED, last_error='No handler registered.')
+        return name, []
+
+    ids = list(due.filter(name=name).order_by('run_at')
+                  .values_list('pk', flat=True)[:job_handler.batch_size])
+    Job.objects.filter(pk__in=ids, status=Job.PENDING).update(
+        status=Job.RUNNING, claimed_by=worker_id, claimed_at=now)
+
+    return name, list(Job.objects.filter(pk__in=ids, status=Job.RUNNING,
+                                         claimed_by=worker_id, claimed_at=now))
+
+
+def run_batch(name, jobs):
+    """
+    Pass the payloads of 'jobs' to their handler. Jobs that succeed are deleted;
+    jobs that fail are rescheduled with backoff until they run out of attempts.
+    Jobs that were requeued as stale while the handler ran now belong to
+    another claim and are left alone.
+    """
+    claims = [current_claim(job) for job in jobs]
+    try:
+        HANDLERS[name].func([json.loads(job.payload) for job in jobs])
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        for job, claim in zip(jobs, claims):
+            record_failure(job, error, now)
+            save_failure(claim, job)
+        return False
+
+    # All jobs in a batch share one claim
+    Job.objects.filter(pk__in=[job.pk for job in jobs], status=Job.RUNNING,
+                       claimed_by=jobs[0].claimed_by, claimed_at=jobs[0].claimed_at).delete()
+    return True
+
+
+def run_pending(worker_id=None, max_batches=None):
+    """
+    Process due jobs until the queue is empty or 'max_batches' batches have been
+    run. Returns the number of jobs processed.
+    """
+    load_tasks()
+    worker_id = worker_id or default_worker_id()
+    requeue_stale_jobs()
+
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        name, jobs = claim_batch(worker_id)
+        if name is None:
+            break
+        if jobs:
+            run_batch(name, jobs)
+            processed += len(jobs)
+        batches += 1
+
+    return processed
+
+
+def work(worker_id=None, poll_interval=1.0):
+    """
+    Worker loop used by 'runworkers'. Runs forever; errors talking to the
+    database, such as "database is locked" or a dropped connection, are logged
+    and the worker carries on after a pause with a fresh connection.
+    """
+    worker_id = worker_id or default_worker_id()
+    while True:
+        try:
+            processed = run_pending(worker_id)
+        except Exception:
+            logger.exception("Worker %s failed while processing jobs.", worker_id)
+            connection.close()
+            processed = 0
+        else:
+            close_old_connections()
+
+        if not processed:
+            time.sleep(poll_interval)
+
+
+def default_worker_id():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def queue_stats():
+    """
+    Summary of the queue for monitoring. 'depth' is the number of pending jobs
+    and 'lag' is how many seconds the oldest due job has been waiting.
+    """
+    now = timezone.now()
+    pending = Job.objects.filter(status=Job.PENDING)
+    oldest_due = pending.filter(run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+
+    return {
+        'depth': pending.count(),
+        'due': pending.filter(run_at__lte=now).count(),
+        'running': Job.objects.filter(status=Job.RUNNING).count(),
+        'failed': Job.objects.filter(status=Job.FAILED).count(),
+        'lag': (now - oldest_due).total_seconds() if oldest_due else 0,
+    }
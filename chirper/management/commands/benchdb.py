@@ -0,0 +1,156 @@
+import multiprocessing
+import random
+import time
+import uuid
+from collections import Counter
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, DatabaseError
+
+from chirper import db
+from chirper.models import UserProfile
+from chirper.serializers import ChirpSerializer
+from chirper.views import HomeChirpListCreate
+
+# Largest number of users deleted per query, within SQLite's variable limit
+DELETE_BATCH_SIZE = 500
+
+
+class BenchmarkRequest(object):
+    """
+    Stands in for the request HomeChirpListCreate reads the current user from.
+    """
+    def __init__(self, user):
+        self.user = user
+
+
+def run_worker(seed, user_ids, duration, write_ratio, results):
+    """
+    Post chirps and read home timelines as random benchmark users until
+    'duration' seconds have passed, then put the latencies and errors on
+    'results'. Both go through HomeChirpListCreate, as the API does.
+    """
+    connection.close()
+    rng = random.Random(seed)
+    users = UserProfile.objects.in_bulk(user_ids)
+    reads, writes, errors = [], [], Counter()
+
+    finish = time.time() + duration
+    while time.time() < finish:
+        view = HomeChirpListCreate(request=BenchmarkRequest(users[rng.choice(user_ids)]))
+        started = time.time()
+        try:
+            if rng.random() < write_ratio:
+                serializer = ChirpSerializer(data={'text': 'Benchmark chirp'})
+                serializer.is_valid(raise_exception=True)
+                view.perform_create(serializer)
+                writes.append(time.time() - started)
+            else:
+                ChirpSerializer(view.get_queryset(), many=True).data
+                reads.append(time.time() - started)
+        except DatabaseError as e:
+            errors['%s: %s' % (e.__class__.__name__, e)] += 1
+
+    connection.close()
+    results.put((reads, writes, errors))
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return 0
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks concurrent chirp writes and home timeline reads from several '
+            'worker processes. It writes to the configured database, so point '
+            'CHIRPER_DB_NAME at a scratch copy and pass --allow-writes. The users it '
+            'creates, and their chirps, are deleted afterwards.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=4,
+            help='Number of worker processes.'),
+        make_option('--duration', type='float', default=10.0,
+            help='Seconds to run for.'),
+        make_option('--write-ratio', type='float', default=0.2,
+            help='Fraction of operations that post a chirp.'),
+        make_option('--users', type='int', default=100,
+            help='Number of benchmark users to create.'),
+        make_option('--follows', type='int', default=20,
+            help='Number of other benchmark users each one follows.'),
+        make_option('--allow-writes', action='store_true', default=False,
+            help='Confirm that the configured database may be written to.'),
+    )
+
+    def handle(self, *args, **options):
+        if not options['allow_writes']:
+            raise CommandError('benchdb creates and deletes users and chirps in %s. Run it against '
+                               'a scratch copy (set CHIRPER_DB_NAME) and pass --allow-writes.'
+                               % connection.settings_dict['NAME'])
+
+        for name, value in sorted(db.effective_settings().items()):
+            self.stdout.write('%s: %s' % (name, value))
+
+        user_ids = self.create_users(options['users'], options['follows'])
+        try:
+            reads, writes, errors, elapsed = self.run(user_ids, options)
+        finally:
+            self.delete_users(user_ids)
+
+        self.stdout.write('Ran %d reads and %d writes in %.1f seconds (%.0f operations/second).'
+                          % (len(reads), len(writes), elapsed, (len(reads) + len(writes)) / elapsed))
+        for error, count in errors.most_common():
+            self.stdout.write('%d failed with %s' % (count, error))
+        for label, latencies in (('Reads', reads), ('Writes', writes)):
+            latencies.sort()
+            self.stdout.write('%s: p50 %.1fms, p95 %.1fms, p99 %.1fms' % (
+                label, percentile(latencies, 0.5), percentile(latencies, 0.95),
+                percentile(latencies, 0.99)))
+
+    def create_users(self, count, follows):
+        """
+        Create the benchmark users and their follows, and return the new users'
+        ids. Only these users are deleted afterwards.
+        """
+        # A random tag keeps the usernames clear of existing accounts
+        prefix = 'bench_%s_' % uuid.uuid4().hex[:8]
+        with transaction.atomic():
+            user_ids = [UserProfile.objects.create(username='%s%d' % (prefix, number), password='!').pk
+                        for number in range(count)]
+
+        Follow = UserProfile.following.through
+        rng = random.Random(0)
+        Follow.objects.bulk_create(
+            [Follow(from_userprofile_id=user_id, to_userprofile_id=other_id)
+             for user_id in user_ids
+             for other_id in rng.sample([pk for pk in user_ids if pk != user_id],
+                                        min(follows, count - 1))])
+        return user_ids
+
+    def delete_users(self, user_ids):
+        for first in range(0, len(user_ids), DELETE_BATCH_SIZE):
+            UserProfile.objects.filter(pk__in=user_ids[first:first + DELETE_BATCH_SIZE]).delete()
+
+    def run(self, user_ids, options):
+        # Database connections must not be shared with the forked workers
+        connection.close()
+
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=run_worker, args=(
+                       seed, user_ids, options['duration'], options['write_ratio'], results))
+                   for seed in range(options['processes'])]
+        started = time.time()
+        for worker in workers:
+            worker.start()
+
+        reads, writes, errors = [], [], Counter()
+        for worker in workers:
+            worker_reads, worker_writes, worker_errors = results.get()
+            reads.extend(worker_reads)
+            writes.extend(worker_writes)
+            errors.update(worker_errors)
+        for worker in workers:
+            worker.join()
+
+        return reads, writes, errors, time.time() - started
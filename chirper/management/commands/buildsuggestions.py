@@ -0,0 +1,45 @@
+import time
+from optparse import make_option
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from chirper import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Recomputes every user\'s "who to follow" suggestions from the follow graph '
+            'and reports how long loading, computing and writing took.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--top-k', type='int', default=recommendations.DEFAULT_TOP_K,
+            help='Number of suggestions to store per user.'),
+        make_option('--benchmark', type='int', metavar='EDGES', default=0,
+            help='Time the computation on a random graph with this many edges instead '
+                 'of rebuilding the stored suggestions.'),
+        make_option('--benchmark-users', type='int', default=100000,
+            help='Number of users in the random benchmark graph.'),
+    )
+
+    def handle(self, *args, **options):
+        top_k = options['top_k']
+
+        if options['benchmark']:
+            random = np.random.RandomState(0)
+            followers = random.randint(0, options['benchmark_users'], options['benchmark'])
+            followees = random.randint(0, options['benchmark_users'], options['benchmark'])
+            distinct = followers != followees
+            started = time.time()
+            suggestions = len(recommendations.compute_suggestions(
+                followers[distinct], followees[distinct], top_k)[0])
+            self.stdout.write('Computed %d suggestions from %d random follow edges in %.2f seconds '
+                              '(computation only; nothing was read or written).'
+                              % (suggestions, distinct.sum(), time.time() - started))
+            return
+
+        stats = recommendations.rebuild_suggestions(top_k)
+        self.stdout.write('Rebuilt %d suggestions from %d follow edges in %.2f seconds: '
+                          'load %.2fs, compute %.2fs, write %.2fs.'
+                          % (stats['suggestions'], stats['edges'],
+                             stats['load'] + stats['compute'] + stats['write'],
+                             stats['load'], stats['compute'], stats['write']))
@@ -0,0 +1,46 @@
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from chirper import jobs
+
+
+def start_worker(worker_number, poll_interval):
+    worker_id = '%s/%d' % (jobs.default_worker_id(), worker_number)
+    jobs.work(worker_id, poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Runs background job workers until interrupted.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=multiprocessing.cpu_count(),
+            help='Number of worker processes to start. Defaults to the CPU count.'),
+        make_option('--poll-interval', type='float', default=1.0,
+            help='Seconds an idle worker waits before checking the queue again.'),
+    )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        poll_interval = options['poll_interval']
+
+        # Database connections must not be shared with the forked workers
+        connection.close()
+
+        workers = []
+        for number in range(processes):
+            worker = multiprocessing.Process(target=start_worker, args=(number, poll_interval))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        self.stdout.write('Started %d worker(s).' % processes)
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def create_index(apps, schema_editor):
+    schema_editor.execute(
+        'CREATE INDEX chirper_userprofile_following_to_from '
+        'ON chirper_userprofile_following (to_userprofile_id, from_userprofile_id)')
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX chirper_userprofile_following_to_from')
+
+
+class Migration(migrations.Migration):
+    """
+    The unique (from_userprofile_id, to_userprofile_id) index on the following
+    table already covers paging through who a user follows. This adds the
+    reverse index so that paging through a user's followers is just as cheap.
+
+    RunPython rather than RunSQL, which needs sqlparse on Django 1.7.
+    """
+
+    dependencies = [
+        ('chirper', '0004_suggestion'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chirper', '0005_follow_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chirp',
+            name='time_posted',
+            field=models.DateTimeField(null=True, db_index=True),
+            preserve_default=True,
+        ),
+    ]
@@ -7,5 +7,49 @@ class UserProfile(AbstractUser):
 
 class Chirp(models.Model):
     author = models.ForeignKey(UserProfile, related_name='chirps', null=True)
-    time_posted = models.DateTimeField(null=True)
+    time_posted = models.DateTimeField(null=True, db_index=True)
     text = models.CharField(max_length=140)
+
+class Job(models.Model):
+    """
+    A unit of deferred work for the background workers. Jobs are picked up by
+    the 'runworkers' management command; see chirper.jobs for the queue API.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    dedupe_key = models.CharField(max_length=255, blank=True, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now)
+    run_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        # (status, run_at) finds the oldest due job of any name, and
+        # (status, name, run_at) the rest of a batch with that name
+        index_together = (('status', 'run_at'), ('status', 'name', 'run_at'))
+
+class Suggestion(models.Model):
+    """
+    A precomputed 'who to follow' suggestion. 'score' is the number of people
+    the user follows who also follow the suggested user, and 'rank' orders a
+    user's suggestions from best (0) to worst.
+    """
+    user = models.ForeignKey(UserProfile, related_name='suggestions')
+    suggested = models.ForeignKey(UserProfile, related_name='+')
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = (('user', 'rank'),)
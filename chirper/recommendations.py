@@ -0,0 +1,137 @@
+"""
+Friends-of-friends 'who to follow' suggestions.
+
+rebuild_suggestions() recomputes every user's suggestions in one pass using a
+sparse adjacency matrix of the follow graph, and is run periodically by the
+'buildsuggestions' management command. The results are written a few hundred
+users at a time in short transactions, so the rebuild never holds SQLite's
+write lock for long. refresh_user() recomputes a single
+user's suggestions with one aggregate query; the 'follow_changed' job handler
+uses it to keep the person who followed or unfollowed up to date between
+rebuilds.
+"""
+import time
+from itertools import chain
+
+import numpy as np
+from scipy import sparse
+
+from django.db import transaction
+from django.db.models import Count
+
+from chirper.models import UserProfile, Suggestion
+
+DEFAULT_TOP_K = 10
+
+# Users whose suggestions are replaced per transaction by rebuild_suggestions
+USERS_PER_TRANSACTION = 500
+
+Follow = UserProfile.following.through
+
+
+def compute_suggestions(followers, followees, top_k=DEFAULT_TOP_K):
+    """
+    Compute the top 'top_k' suggestions for every user from two parallel arrays
+    of user ids describing the follow edges. Returns four arrays: user ids,
+    suggested user ids, scores and ranks.
+
+    If A is the adjacency matrix, (A * A)[u, v] counts the people u follows who
+    follow v. Users that u already follows, and u itself, are then removed and
+    the remaining entries of each row are ranked by score, ties going to the
+    lower user id.
+    """
+    followers = np.asarray(followers)
+    followees = np.asarray(followees)
+    ids, edges = np.unique(np.concatenate((followers, followees)), return_inverse=True)
+    sources, targets = np.split(edges, 2)
+    size = len(ids)
+
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(sources), dtype=np.int32), (sources, targets)), shape=(size, size))
+    adjacency.data[:] = 1
+    scores = adjacency.dot(adjacency)
+    scores = (scores - scores.multiply(adjacency)).tocoo()
+    # Drop the diagonal and the zeroed-out existing follows with a mask, rather
+    # than setdiag(), which changes the sparsity structure of a CSR matrix
+    candidates = (scores.row != scores.col) & (scores.data != 0)
+    scores = sparse.csr_matrix(
+        (scores.data[candidates], (scores.row[candidates], scores.col[candidates])),
+        shape=(size, size))
+    scores.sort_indices()
+
+    # Sort every row by descending score with a single stable argsort on a
+    # combined (row, -score) key; sorted column indices settle the ties
+    rows = np.repeat(np.arange(size), np.diff(scores.indptr))
+    key = rows.astype(np.int64) * (int(scores.data.max()) + 1 if scores.nnz else 1) - scores.data
+    order = np.argsort(key, kind='mergesort')
+    ranks = np.arange(len(order)) - scores.indptr[rows[order]]
+    keep = order[ranks < top_k]
+
+    return ids[rows[keep]], ids[scores.indices[keep]], scores.data[keep], ranks[ranks < top_k]
+
+
+def load_follow_edges():
+    """
+    Read the follow graph as two arrays of follower and followee ids, without
+    building a Python tuple per edge.
+    """
+    rows = Follow.objects.values_list('from_userprofile_id', 'to_userprofile_id').iterator()
+    edges = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+    return edges[:, 0], edges[:, 1]
+
+
+def rebuild_suggestions(top_k=DEFAULT_TOP_K, users_per_transaction=USERS_PER_TRANSACTION):
+    """
+    Replace every stored suggestion with a freshly computed set. Returns a dict
+    with the number of follow edges read and suggestions written, and the
+    seconds spent loading, computing and writing.
+    """
+    started = time.time()
+    followers, followees = load_follow_edges()
+    loaded = time.time()
+    users, suggested, scores, ranks = compute_suggestions(followers, followees, top_k)
+    computed = time.time()
+
+    # Users with new suggestions, plus users whose old ones must be removed.
+    # 'users' is sorted, so each range of user ids is a contiguous slice.
+    stored = np.fromiter(Suggestion.objects.values_list('user_id', flat=True).distinct().iterator(),
+                         dtype=np.int64)
+    affected = np.union1d(users, stored)
+    for first in range(0, len(affected), users_per_transaction):
+        low, high = affected[first], affected[min(first + users_per_transaction, len(affected)) - 1]
+        start = np.searchsorted(users, low, side='left')
+        end = np.searchsorted(users, high, side='right')
+        with transaction.atomic():
+            Suggestion.objects.filter(user__gte=int(low), user__lte=int(high)).delete()
+            Suggestion.objects.bulk_create(
+                [Suggestion(user_id=int(user), suggested_id=int(other), score=int(score), rank=int(rank))
+                 for user, other, score, rank in zip(users[start:end], suggested[start:end],
+                                                     scores[start:end], ranks[start:end])])
+
+    return {
+        'edges': len(followers),
+        'suggestions': len(users),
+        'load': loaded - started,
+        'compute': computed - loaded,
+        'write': time.time() - computed,
+    }
+
+
+def refresh_user(user_id, top_k=DEFAULT_TOP_K):
+    """
+    Recompute the suggestions of a single user.
+    """
+    following = Follow.objects.filter(from_userprofile=user_id).values('to_userprofile')
+    candidates = (Follow.objects
+        .filter(from_userprofile__in=following)
+        .exclude(to_userprofile__in=following)
+        .exclude(to_userprofile=user_id)
+        .values('to_userprofile')
+        .annotate(score=Count('id'))
+        .order_by('-score', 'to_userprofile'))[:top_k]
+
+    with transaction.atomic():
+        Suggestion.objects.filter(user=user_id).delete()
+        Suggestion.objects.bulk_create(
+            [Suggestion(user_id=user_id, suggested_id=row['to_userprofile'], score=row['score'], rank=rank)
+             for rank, row in enumerate(candidates)])
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.utils import timezone
-from chirper.models import UserProfile, Chirp
+from chirper.models import UserProfile, Chirp, Suggestion
 
 class UserProfileSerializer(serializers.ModelSerializer):
     # Chirps have a reverse relationship to users, so we need to
@@ -30,3 +30,18 @@ class ChirpSerializer(serializers.ModelSerializer):
         model = Chirp
         fields = ('author', 'time_posted', 'text')
         read_only_fields = ('author', 'time_posted',)
+
+class UserSummarySerializer(serializers.Serializer):
+    """
+    A lightweight, read-only representation of a user for long lists.
+    """
+    id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(read_only=True)
+
+class SuggestionSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='suggested_id', read_only=True)
+    username = serializers.CharField(source='suggested.username', read_only=True)
+
+    class Meta:
+        model = Suggestion
+        fields = ('id', 'username', 'score')
@@ -0,0 +1,16 @@
+"""
+Background job handlers. Register handlers here with chirper.jobs.handler so
+that both the web processes and the 'runworkers' workers know about them.
+"""
+from chirper import recommendations
+from chirper.jobs import handler
+
+
+@handler('follow_changed', batch_size=100)
+def refresh_suggestions(payloads):
+    """
+    Refresh the suggestions of users who have followed or unfollowed someone.
+    Other users affected by the change are caught up by the next full rebuild.
+    """
+    for user_id in set(payload['user'] for payload in payloads):
+        recommendations.refresh_user(user_id)
@@ -1,12 +1,32 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import caches
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 
 from rest_framework import status
-from rest_framework.test import APIRequestFactory, APIClient
-
-from chirper.models import UserProfile, Chirp
-
-class UserCreateTests(TestCase):
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APIClient, force_authenticate
+from rest_framework.views import APIView
+
+from chirper import db, jobs, recommendations, throttling, views
+from chirper.admin import ApproximateCountPaginator
+from chirper.models import UserProfile, Chirp, Job, Suggestion
+
+class ChirperTestCase(TestCase):
+    """
+    Starts every test with empty throttle buckets, so that requests made by
+    earlier tests can't get later ones throttled.
+    """
+    def _pre_setup(self):
+        super(ChirperTestCase, self)._pre_setup()
+        caches['throttle'].clear()
+
+class UserCreateTests(ChirperTestCase):
     #
     # Tests
     #
@@ -61,7 +81,7 @@ class UserCreateTests(TestCase):
         }
         return self.client.post(url, data, format='json')
 
-class UserLoginTests(TestCase):
+class UserLoginTests(ChirperTestCase):
 
     # Load some test data
     fixtures = ['DbForTesting.json']
@@ -122,7 +142,7 @@ class UserLoginTests(TestCase):
         }
         return self.client.post(url, data, format='json')
 
-class UserLogoutTests(TestCase):
+class UserLogoutTests(ChirperTestCase):
 
     # Load some test data
     fixtures = ['DbForTesting.json']
@@ -158,7 +178,7 @@ class UserLogoutTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertEqual(response.data, response_data)
 
-class UserDetailTests(TestCase):
+class UserDetailTests(ChirperTestCase):
 
     # Load some test data
     fixtures = ['DbForTesting.json']
@@ -226,7 +246,7 @@ class UserDetailTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertEqual(response.data, response_data)
 
-class CreateNewChirp(TestCase):
+class CreateNewChirp(ChirperTestCase):
 
     # Load some test data
     fixtures = ['DbForTesting.json']
@@ -279,7 +299,7 @@ class CreateNewChirp(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-class FollowUserTests(TestCase):
+class FollowUserTests(ChirperTestCase):
 
     # Load some test data
     fixtures = ['DbForTesting.json']
@@ -327,7 +347,7 @@ class FollowUserTests(TestCase):
         }
         return client.put(url, data, format="json")
 
-class UnfollowUserTests(TestCase):
+class UnfollowUserTests(ChirperTestCase):
 
     # Load some test data
     fixtures = ['DbForTesting.json']
@@ -374,3 +394,545 @@ class UnfollowUserTests(TestCase):
             "user_to_unfollow":user_to_unfollow
         }
         return client.put(url, data, format="json")
+
+class JobQueueTests(ChirperTestCase):
+
+    def setUp(self):
+        self.processed = []
+        jobs.handler('test_job', batch_size=10, max_attempts=2)(self.processed.append)
+        jobs.handler('failing_job', max_attempts=2)(self.fail)
+
+    def tearDown(self):
+        del jobs.HANDLERS['test_job']
+        del jobs.HANDLERS['failing_job']
+
+    #
+    # Tests
+    #
+    def test_similar_jobs_are_run_in_one_batch(self):
+        """
+        Pending jobs with the same name should be passed to their handler together
+        and deleted once it succeeds.
+        """
+        for number in range(3):
+            jobs.enqueue('test_job', {'number': number})
+
+        processed = jobs.run_pending()
+
+        self.assertEqual(processed, 3)
+        self.assertEqual(self.processed, [[{'number': 0}, {'number': 1}, {'number': 2}]])
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_duplicate_pending_job_is_not_queued(self):
+        """
+        Enqueuing a job whose dedupe key matches a pending job should do nothing.
+        """
+        jobs.enqueue('test_job', dedupe_key='same')
+        duplicate = jobs.enqueue('test_job', dedupe_key='same')
+
+        self.assertEqual(duplicate, None)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_job_without_handler_is_rejected(self):
+        """
+        Enqueuing a job that no handler is registered for should raise an error
+        rather than creating a job.
+        """
+        self.assertRaises(ValueError, jobs.enqueue, 'no_such_job')
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_failing_job_is_retried_with_backoff_then_failed(self):
+        """
+        A job whose handler raises should be rescheduled with a backoff delay, and
+        marked as failed once it runs out of attempts.
+        """
+        job = jobs.enqueue('failing_job')
+
+        jobs.run_pending()
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.run_at > timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run_pending()
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_job_counts_as_failed_attempt(self):
+        """
+        A job left running by a dead worker should be requeued with its attempt
+        counted, and marked as failed once it runs out of attempts.
+        """
+        job = jobs.enqueue('test_job')
+        stale = timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 1)
+
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, claimed_at=stale)
+        jobs.requeue_stale_jobs()
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(job.attempts, 1)
+
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, claimed_at=stale)
+        jobs.requeue_stale_jobs()
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_finishing_worker_leaves_reclaimed_jobs_alone(self):
+        """
+        If a slow batch was requeued and claimed by another worker, the first
+        worker finishing it should neither delete nor overwrite those jobs.
+        """
+        job = jobs.enqueue('test_job')
+        name, claimed = jobs.claim_batch('slow-worker')
+        Job.objects.filter(pk=job.pk).update(claimed_by='other-worker')
+
+        jobs.run_batch(name, claimed)
+
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.claimed_by, 'other-worker')
+
+    def test_queue_stats_for_admin_user(self):
+        """
+        The job stats view should report the queue depth to admin users.
+        """
+        jobs.enqueue('test_job')
+        jobs.enqueue('test_job', delay=60)
+
+        client = APIClient()
+        client.force_authenticate(UserProfile.objects.create(username='Admin', is_staff=True))
+        response = client.get(reverse('chirper:jobStats'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['depth'], 2)
+        self.assertEqual(response.data['due'], 1)
+
+    #
+    # Helper method
+    #
+    def fail(self, payloads):
+        raise ValueError("Failed on purpose.")
+
+class SuggestionTests(ChirperTestCase):
+
+    # Load some test data
+    fixtures = ['DbForTesting.json']
+
+    def setUp(self):
+        # TestUser follows UnfollowTestUser, who follows FollowTestUser
+        self.user = UserProfile.objects.get(username='TestUser')
+        UserProfile.objects.get(username='UnfollowTestUser').following.add(
+            UserProfile.objects.get(username='FollowTestUser'))
+        recommendations.rebuild_suggestions()
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    #
+    # Tests
+    #
+    def test_suggestions_are_friends_of_friends(self):
+        """
+        The suggestions view should list users followed by the users that the
+        current user follows, along with how many of them follow each one.
+        """
+        response = self.client.get(reverse('chirper:suggestions'))
+
+        response_data = [{
+            "id":UserProfile.objects.get(username='FollowTestUser').pk,
+            "username":"FollowTestUser",
+            "score":1
+        }]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, response_data)
+
+    def test_following_a_suggestion_removes_it(self):
+        """
+        Once the queued job has run, a user that has just been followed should no
+        longer be suggested.
+        """
+        url = reverse('chirper:followUser')
+        self.client.put(url, {"user_to_follow":"FollowTestUser"}, format="json")
+        jobs.run_pending()
+
+        self.assertEqual(self.user.suggestions.count(), 0)
+
+    def test_rebuild_writes_many_suggestions(self):
+        """
+        A rebuild should store more suggestions than fit in one SQLite insert,
+        across several transactions, and remove suggestions that no longer
+        apply on the next rebuild.
+        """
+        UserProfile.objects.bulk_create(
+            [UserProfile(username='Many%d' % number, password='!') for number in range(30)] +
+            [UserProfile(username='Suggested%d' % number, password='!') for number in range(12)] +
+            [UserProfile(username='Hub', password='!')])
+        hub = UserProfile.objects.get(username='Hub')
+        Follow = UserProfile.following.through
+        Follow.objects.bulk_create(
+            [Follow(from_userprofile_id=user.pk, to_userprofile_id=hub.pk)
+             for user in UserProfile.objects.filter(username__startswith='Many')] +
+            [Follow(from_userprofile_id=hub.pk, to_userprofile_id=user.pk)
+             for user in UserProfile.objects.filter(username__startswith='Suggested')])
+        many = Suggestion.objects.filter(user__username__startswith='Many')
+
+        recommendations.rebuild_suggestions(users_per_transaction=7)
+        self.assertEqual(many.count(), 300)
+
+        hub.following.clear()
+        recommendations.rebuild_suggestions(users_per_transaction=7)
+        self.assertEqual(many.count(), 0)
+
+    def test_compute_suggestions_ranks_by_score(self):
+        """
+        Suggestions followed by more of the user's followees should rank higher,
+        and users already followed should never be suggested.
+        """
+        users, suggested, scores, ranks = recommendations.compute_suggestions(
+            [1, 1, 2, 3, 3, 2], [2, 3, 4, 4, 5, 1], top_k=2)
+
+        self.assertEqual(list(users), [1, 1, 2])
+        self.assertEqual(list(suggested), [4, 5, 3])
+        self.assertEqual(list(scores), [2, 1, 1])
+        self.assertEqual(list(ranks), [0, 1, 0])
+
+class FollowListTests(ChirperTestCase):
+
+    # Load some test data
+    fixtures = ['DbForTesting.json']
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.login(username='TestUser', password='Password')
+
+    #
+    # Tests
+    #
+    def test_list_followers(self):
+        """
+        The followers view should list the id and username of each follower.
+        """
+        response = self.list_users('followers', 'TestUser')
+
+        response_data = {
+            "next":None,
+            "results":[self.summary("FollowerTestUser")]
+        }
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, response_data)
+
+    def test_list_following_in_pages(self):
+        """
+        Following the "next" URL should return the page after the last user seen,
+        and the last page should have no "next" URL.
+        """
+        self.follow('TestUser', 'FollowTestUser')
+
+        first_page = self.list_users('following', 'TestUser', page_size=1)
+        second_page = self.client.get(first_page.data['next'])
+
+        self.assertEqual(first_page.data['results'], [self.summary("FollowTestUser")])
+        self.assertEqual(second_page.data['results'], [self.summary("UnfollowTestUser")])
+        self.assertEqual(second_page.data['next'], None)
+
+    def test_list_mutual_follows(self):
+        """
+        With "mutual" set, only users who follow and are followed by the user
+        should be listed.
+        """
+        self.follow('TestUser', 'FollowerTestUser')
+
+        followers = self.list_users('followers', 'TestUser', mutual=1)
+        following = self.list_users('following', 'TestUser', mutual=1)
+
+        self.assertEqual(followers.data['results'], [self.summary("FollowerTestUser")])
+        self.assertEqual(following.data['results'], [self.summary("FollowerTestUser")])
+
+    def test_mutual_scan_is_limited(self):
+        """
+        A mutual page should stop after looking at a limited number of rows and
+        return a "next" URL that continues from there.
+        """
+        self.follow('TestUser', 'FollowerTestUser')
+        self.follow('TestUser', 'FollowTestUser')
+        views.FollowingList.mutual_scan_limit = 1
+        try:
+            first_page = self.list_users('following', 'TestUser', mutual=1)
+            second_page = self.client.get(first_page.data['next'])
+            third_page = self.client.get(second_page.data['next'])
+        finally:
+            del views.FollowingList.mutual_scan_limit
+
+        self.assertEqual(first_page.data['results'], [])
+        self.assertEqual(second_page.data['results'], [])
+        self.assertEqual(third_page.data['results'], [self.summary("FollowerTestUser")])
+        self.assertEqual(third_page.data['next'], None)
+
+    def test_mutual_false_lists_everyone(self):
+        """
+        Setting "mutual" to a false value should not filter the list.
+        """
+        self.follow('TestUser', 'FollowerTestUser')
+
+        response = self.list_users('following', 'TestUser', mutual='false')
+
+        self.assertEqual(response.data['results'],
+                         [self.summary("UnfollowTestUser"), self.summary("FollowerTestUser")])
+
+    def test_list_followers_invalid_page_size(self):
+        """
+        A page size that isn't a positive number should return a 400 response.
+        """
+        response = self.list_users('followers', 'TestUser', page_size='none')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_followers_for_nonexistent_user(self):
+        """
+        Listing the followers of a user that doesn't exist should return a 404
+        response.
+        """
+        response = self.list_users('followers', 'NoUser')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    #
+    # Helper methods
+    #
+    def list_users(self, relation, username, **params):
+        url = reverse('chirper:' + relation, kwargs={'username':username})
+        return self.client.get(url, params)
+
+    def follow(self, username, other_username):
+        UserProfile.objects.get(username=username).following.add(
+            UserProfile.objects.get(username=other_username))
+
+    def summary(self, username):
+        return {
+            "id":UserProfile.objects.get(username=username).pk,
+            "username":username
+        }
+
+class LimitedWriteThrottle(throttling.UserWriteThrottle):
+    # Own scopes, so these don't share buckets with the real throttles
+    scope = 'test_user_write'
+    rate = '2/min'
+
+class LimitedAnonWriteThrottle(throttling.AnonWriteThrottle):
+    scope = 'test_anon_write'
+    rate = '2/min'
+
+class LimitedView(APIView):
+    permission_classes = (AllowAny,)
+    throttle_classes = (LimitedWriteThrottle, LimitedAnonWriteThrottle)
+
+    def get(self, request, format=None):
+        return Response("OK")
+
+    def post(self, request, format=None):
+        return Response("OK")
+
+class ThrottleTests(ChirperTestCase):
+
+    def setUp(self):
+        throttling.rejections.clear()
+        self.user = UserProfile.objects.create(username='ThrottleUser')
+
+    #
+    # Tests
+    #
+    def test_burst_over_budget_is_rejected(self):
+        """
+        Once a user has used up their bucket, further writes should fail with a
+        429 response and a Retry-After header.
+        """
+        responses = [self.request('post', self.user) for i in range(3)]
+
+        self.assertEqual(responses[0].status_code, status.HTTP_200_OK)
+        self.assertEqual(responses[1].status_code, status.HTTP_200_OK)
+        self.assertEqual(responses[2].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(1 <= int(responses[2]['Retry-After']) <= 30)
+
+    def test_concurrent_burst_is_limited(self):
+        """
+        Requests arriving at once from several threads should not all be let
+        through on the same token count.
+        """
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(self.request('post', self.user)))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        allowed = [response for response in responses if response.status_code == status.HTTP_200_OK]
+        self.assertEqual(len(allowed), 2)
+
+    def test_reads_have_a_separate_budget(self):
+        """
+        Using up the write budget should not affect reads.
+        """
+        for i in range(3):
+            self.request('post', self.user)
+
+        response = self.request('get', self.user)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_users_have_separate_buckets(self):
+        """
+        One user using up their budget should not affect another user.
+        """
+        for i in range(3):
+            self.request('post', self.user)
+
+        other_user = UserProfile.objects.create(username='OtherUser')
+        response = self.request('post', other_user)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_anonymous_clients_cannot_dodge_by_forwarded_for(self):
+        """
+        Anonymous clients should be throttled by their address, whatever they
+        send in X-Forwarded-For.
+        """
+        responses = [LimitedView.as_view()(APIRequestFactory().post(
+                         '/', HTTP_X_FORWARDED_FOR='10.0.0.%d' % number))
+                     for number in range(3)]
+
+        self.assertEqual(responses[2].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_rejections_are_counted(self):
+        """
+        The throttle stats view should report rejected requests by scope.
+        """
+        for i in range(3):
+            self.request('post', self.user)
+
+        client = APIClient()
+        client.force_authenticate(UserProfile.objects.create(username='Admin', is_staff=True))
+        response = client.get(reverse('chirper:throttleStats'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['test_user_write'], 1)
+        self.assertEqual(response.data['user_write'], 0)
+
+    #
+    # Helper method
+    #
+    def request(self, method, user):
+        request = getattr(APIRequestFactory(), method)('/')
+        force_authenticate(request, user)
+        return LimitedView.as_view()(request)
+
+class AdminTests(ChirperTestCase):
+
+    # Load some test data
+    fixtures = ['DbForTesting.json']
+
+    def setUp(self):
+        UserProfile.objects.create_superuser('AdminUser', 'admin@example.com', 'Password')
+        self.client.login(username='AdminUser', password='Password')
+
+    #
+    # Tests
+    #
+    def test_chirp_changelist(self):
+        """
+        The chirp changelist should load for an admin user.
+        """
+        response = self.client.get(reverse('admin:chirper_chirp_changelist'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_date_hierarchy_hidden_until_year_chosen(self):
+        """
+        The chirp changelist should only show the date hierarchy once a year has
+        been chosen, and should estimate the unfiltered total when drilled down.
+        """
+        url = reverse('admin:chirper_chirp_changelist')
+        top_level = self.client.get(url)
+        drilled_down = self.client.get(url, {'time_posted__year':'2015'})
+
+        self.assertEqual(top_level.context['cl'].date_hierarchy, None)
+        self.assertEqual(drilled_down.status_code, status.HTTP_200_OK)
+        self.assertEqual(drilled_down.context['cl'].date_hierarchy, 'time_posted')
+        self.assertEqual(drilled_down.context['cl'].full_result_count,
+                         Chirp.objects.order_by('-pk')[0].pk)
+
+    def test_user_search_matches_username_prefix(self):
+        """
+        Searching users should match usernames starting with the search term.
+        """
+        url = reverse('admin:chirper_userprofile_changelist')
+        response = self.client.get(url, {'q':'Follow'})
+
+        usernames = sorted(user.username for user in response.context['cl'].result_list)
+        self.assertEqual(usernames, ['FollowTestUser', 'FollowerTestUser'])
+
+    def test_user_change_form(self):
+        """
+        The user change form should load for an admin user.
+        """
+        user = UserProfile.objects.get(username='TestUser')
+        response = self.client.get(reverse('admin:chirper_userprofile_change', args=(user.pk,)))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_unfiltered_count_is_estimated(self):
+        """
+        The paginator should estimate the size of an unfiltered table from its
+        largest primary key, and count filtered querysets exactly.
+        """
+        Chirp.objects.all().delete()
+        chirps = [Chirp.objects.create(text="Chirp %d" % number) for number in range(3)]
+        chirps[0].delete()
+
+        unfiltered = ApproximateCountPaginator(Chirp.objects.all(), 10)
+        filtered = ApproximateCountPaginator(Chirp.objects.filter(text__startswith="Chirp"), 10)
+
+        self.assertEqual(unfiltered.count, chirps[-1].pk)
+        self.assertEqual(filtered.count, 2)
+
+class DatabaseProfileTests(TransactionTestCase):
+
+    # SQLite won't change the synchronous pragma inside a transaction
+
+    #
+    # Tests
+    #
+    @override_settings(DATABASE_PROFILE='production', SQLITE_PRAGMAS=(('synchronous', 'OFF'),))
+    def test_applied_pragmas_pass_check(self):
+        """
+        The configured pragmas should be in effect once applied, and the startup
+        check should then only report the effective settings.
+        """
+        db.apply_pragmas(None, connection)
+        messages = db.check_database_profile(None)
+
+        self.assertEqual(db.effective_settings()['synchronous'], 0)
+        self.assertEqual([message.id for message in messages], ['chirper.I001'])
+
+    @override_settings(DATABASE_PROFILE='production', SQLITE_PRAGMAS=(('journal_mode', 'WAL'),))
+    def test_pragma_that_did_not_take_is_reported(self):
+        """
+        The startup check should warn about a configured pragma that isn't in
+        effect, such as WAL on the in-memory test database.
+        """
+        db.apply_pragmas(None, connection)
+        messages = db.check_database_profile(None)
+
+        self.assertEqual([message.id for message in messages], ['chirper.I001', 'chirper.W001'])
+
+    @override_settings(DATABASE_PROFILE='development', SQLITE_PRAGMAS=())
+    def test_development_profile_check_is_silent(self):
+        """
+        The startup check should report nothing in the development profile.
+        """
+        self.assertEqual(db.check_database_profile(None), [])
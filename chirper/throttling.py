@@ -0,0 +1,117 @@
+"""
+Token bucket request throttles.
+
+Each client gets a bucket that holds up to N tokens and refills at N tokens per
+period, for a rate of "N/period" in DEFAULT_THROTTLE_RATES. A request takes one
+token, so clients can burst up to N requests and are then held to the average
+rate. Buckets live in the process-local 'throttle' cache, so checking one costs
+a cache get and set and no database queries.
+
+Authenticated users are throttled by user id and anonymous users by IP
+address, with separate budgets for reads (safe methods) and writes.
+"""
+import math
+import threading
+from collections import defaultdict
+
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+SCOPES = ('anon_read', 'anon_write', 'user_read', 'user_write')
+
+# Rejections per scope in this process. Kept out of the cache so that culling
+# can't lose them
+rejections = defaultdict(int)
+_rejections_lock = threading.Lock()
+
+# Serialises each bucket's read-modify-write between threads, so a burst can't
+# all read the same token count and all be let through
+_buckets_lock = threading.Lock()
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    cache = caches['throttle']
+    for_reads = True
+
+    def get_cache_key(self, request, view):
+        if (request.method in SAFE_METHODS) != self.for_reads:
+            return None
+
+        ident = self.get_client_ident(request)
+        if ident is None:
+            return None
+
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def get_client_ident(self, request):
+        """
+        Return the identity to throttle the request under, or None if this
+        throttle doesn't apply to the requesting client. Must be overridden.
+        """
+        raise NotImplementedError('.get_client_ident() must be overridden')
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        refill_rate = float(self.num_requests) / self.duration
+        with _buckets_lock:
+            now = self.timer()
+            tokens, last_request = self.cache.get(self.key, (self.num_requests, now))
+            tokens = min(self.num_requests, tokens + (now - last_request) * refill_rate)
+            if tokens >= 1:
+                self.cache.set(self.key, (tokens - 1, now), self.duration)
+                return True
+
+        self.wait_time = math.ceil((1 - tokens) / refill_rate)
+        self.count_rejection()
+        return False
+
+    def wait(self):
+        return self.wait_time
+
+    def count_rejection(self):
+        with _rejections_lock:
+            rejections[self.scope] += 1
+
+
+class AnonReadThrottle(TokenBucketThrottle):
+    scope = 'anon_read'
+
+    def get_client_ident(self, request):
+        if request.user.is_authenticated():
+            return None
+        return self.get_ident(request)
+
+
+class AnonWriteThrottle(AnonReadThrottle):
+    scope = 'anon_write'
+    for_reads = False
+
+
+class UserReadThrottle(TokenBucketThrottle):
+    scope = 'user_read'
+
+    def get_client_ident(self, request):
+        if not request.user.is_authenticated():
+            return None
+        return request.user.pk
+
+
+class UserWriteThrottle(UserReadThrottle):
+    scope = 'user_write'
+    for_reads = False
+
+
+def rejection_counts():
+    """
+    Number of requests this process has rejected in each throttle scope,
+    including any scope outside SCOPES that has rejected something.
+    """
+    with _rejections_lock:
+        return dict((scope, rejections[scope]) for scope in set(SCOPES) | set(rejections))
@@ -9,6 +9,11 @@ urlpatterns = [
     url(r'^home/$', views.HomeChirpListCreate.as_view(), name='home'),
     url(r'^users/$', views.UserList.as_view(), name='userList'),
     url(r'^users/(?P<username>\w+)/$', views.UserDetail.as_view(), name='userDetail'),
+    url(r'^users/(?P<username>\w+)/followers/$', views.FollowerList.as_view(), name='followers'),
+    url(r'^users/(?P<username>\w+)/following/$', views.FollowingList.as_view(), name='following'),
     url(r'^follow/$', views.FollowUser.as_view(), name='followUser'),
     url(r'^unfollow/$', views.UnfollowUser.as_view(), name='unfollowUser'),
+    url(r'^suggestions/$', views.SuggestionList.as_view(), name='suggestions'),
+    url(r'^jobs/stats/$', views.JobQueueStats.as_view(), name='jobStats'),
+    url(r'^throttle/stats/$', views.ThrottleStats.as_view(), name='throttleStats'),
 ]
@@ -1,17 +1,21 @@
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.http import HttpResponseRedirect
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.utils import timezone
 
 from rest_framework import generics, permissions, status, viewsets
 from rest_framework.views import APIView
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.utils.urls import replace_query_param
 
-from chirper.models import UserProfile, Chirp
-from chirper.serializers import UserProfileSerializer, ChirpSerializer
+from chirper import jobs, throttling
+from chirper.models import UserProfile, Chirp, Suggestion
+from chirper.serializers import (UserProfileSerializer, ChirpSerializer, SuggestionSerializer,
+                                 UserSummarySerializer)
 
 
 class UserLogin(APIView):
@@ -108,6 +112,8 @@ class FollowUser(APIView):
                 return Response("Already following this user.", status.HTTP_400_BAD_REQUEST)
 
             request.user.following.add(user_to_follow.pk)
+            jobs.enqueue('follow_changed', {'user': request.user.pk, 'other': user_to_follow.pk},
+                         dedupe_key=str(request.user.pk))
             return Response("OK", status.HTTP_200_OK)
 
         return Response("Not found", status.HTTP_404_NOT_FOUND)
@@ -131,6 +137,136 @@ class UnfollowUser(APIView):
                 return Response("Not following this user.", status.HTTP_400_BAD_REQUEST)
 
             request.user.following.remove(user_to_unfollow)
+            jobs.enqueue('follow_changed', {'user': request.user.pk, 'other': user_to_unfollow.pk},
+                         dedupe_key=str(request.user.pk))
             return Response("OK", status.HTTP_200_OK)
 
         return Response("Not found", status.HTTP_404_NOT_FOUND)
+
+class FollowList(APIView):
+    """
+    Base view for paging through one side of a user's follow relationships.
+    Pages are fetched by keyset rather than by offset: the response contains a
+    "next" URL carrying the id of the last user returned in its "after"
+    parameter, so every page is a single range scan on an index of the
+    following table no matter how deep into the list it is. Accepts the
+    optional query parameters "page_size" and "mutual"; when "mutual" is true
+    only users who follow and are followed by the user are listed.
+
+    Mutual follows can be sparse, so a mutual page looks at no more than
+    'mutual_scan_limit' rows of the list. If it runs out before filling the
+    page, it returns what it found, possibly nothing, with a "next" URL that
+    carries on from the last row looked at. Keep following "next" until it is
+    null.
+    """
+    page_size = 50
+    max_page_size = 500
+    mutual_scan_limit = 5000
+
+    # Column of the following table holding the user being looked at, and the
+    # column holding the users to list
+    user_column = None
+    listed_column = None
+
+    def get(self, request, username, format=None):
+        user = get_object_or_404(UserProfile, username = username)
+
+        try:
+            after = int(request.query_params.get('after', 0))
+            page_size = min(int(request.query_params.get('page_size', self.page_size)), self.max_page_size)
+        except ValueError:
+            return Response({'detail':'Invalid page parameters.'}, status=status.HTTP_400_BAD_REQUEST)
+        if page_size < 1:
+            return Response({'detail':'Invalid page parameters.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        Follow = UserProfile.following.through
+        rows = Follow.objects.filter(**{
+            self.user_column: user.pk,
+            self.listed_column + '__gt': after,
+        })
+        scan_end = None
+        if request.query_params.get('mutual', '').lower() in ('1', 'true', 'yes', 'on'):
+            # Bound the range looked at, then probe the unique (from, to) index
+            # once for each row in it. The row after the last one looked at
+            # tells whether the list carries on past the scan.
+            boundary = list(rows.order_by(self.listed_column)
+                            .values_list(self.listed_column, flat=True)
+                            [self.mutual_scan_limit - 1:self.mutual_scan_limit + 1])
+            if len(boundary) > 1:
+                scan_end = boundary[0]
+                rows = rows.filter(**{self.listed_column + '__lte': scan_end})
+
+            quote = connection.ops.quote_name
+            table = quote(Follow._meta.db_table)
+            listed = quote(self.listed_column + '_id')
+            rows = rows.extra(
+                where=['EXISTS (SELECT 1 FROM %s mutual WHERE mutual.%s = %%s AND mutual.%s = %s.%s)'
+                       % (table, listed, quote(self.user_column + '_id'), table, listed)],
+                params=[user.pk])
+
+        rows = list(rows.order_by(self.listed_column)
+                    .values_list(self.listed_column, self.listed_column + '__username')[:page_size + 1])
+
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_url = replace_query_param(request.build_absolute_uri(), 'after', rows[-1][0])
+        elif scan_end is not None:
+            next_url = replace_query_param(request.build_absolute_uri(), 'after', scan_end)
+
+        users = [{'id':pk, 'username':name} for pk, name in rows]
+        response = {
+            'next':next_url,
+            'results':UserSummarySerializer(users, many=True).data,
+        }
+        return Response(response, status.HTTP_200_OK)
+
+class FollowerList(FollowList):
+    """
+    Provides a GET method to page through the users following a user. Accepts
+    the 'username' in "api/users/username/followers/" as an argument.
+    """
+    user_column = 'to_userprofile'
+    listed_column = 'from_userprofile'
+
+class FollowingList(FollowList):
+    """
+    Provides a GET method to page through the users a user is following. Accepts
+    the 'username' in "api/users/username/following/" as an argument.
+    """
+    user_column = 'from_userprofile'
+    listed_column = 'to_userprofile'
+
+class SuggestionList(generics.ListAPIView):
+    """
+    Provides a GET method to list the users the current user might want to
+    follow, best first. Suggestions are people followed by the people the user
+    follows, and are precomputed in the background.
+    """
+    serializer_class = SuggestionSerializer
+
+    def get_queryset(self):
+        return (Suggestion.objects.filter(user = self.request.user)
+                .select_related('suggested').order_by('rank'))
+
+class JobQueueStats(APIView):
+    """
+    Provides a GET method for monitoring the background job queue. Returns the
+    queue depth and the lag, in seconds, of the oldest job that is due to run.
+    Only available to admin users.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response(jobs.queue_stats(), status.HTTP_200_OK)
+
+class ThrottleStats(APIView):
+    """
+    Provides a GET method for monitoring request throttling. Returns the number
+    of requests this process has rejected in each throttle scope. Only available
+    to admin users.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response(throttling.rejection_counts(), status.HTTP_200_OK)